@@ -1,10 +1,16 @@
 """Kaggle Dataset workflow plugin module"""
+import csv
 import tempfile
-from typing import Sequence, Tuple, Any
+from typing import Sequence, Tuple, Any, IO
 import os
+import re
+import shutil
 import time
-from zipfile import ZipFile
+from contextlib import ExitStack
+from urllib.parse import unquote
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
 
+from cmem.cmempy.workspace.tasks import get_task
 from kaggle.rest import ApiException
 from kaggle.api import KaggleApi
 from cmem_plugin_base.dataintegration.context import (
@@ -18,7 +24,11 @@ from cmem_plugin_base.dataintegration.parameter.dataset import DatasetParameterT
 from cmem_plugin_base.dataintegration.parameter.password import Password
 from cmem_plugin_base.dataintegration.plugins import WorkflowPlugin
 from cmem_plugin_base.dataintegration.types import StringParameterType, Autocompletion
-from cmem_plugin_base.dataintegration.utils import write_to_dataset
+from cmem_plugin_base.dataintegration.utils import (
+    setup_cmempy_user_access,
+    split_task_id,
+    write_to_dataset,
+)
 
 api = KaggleApi()
 
@@ -31,6 +41,13 @@ DATASET_TYPES = {
     "txt": "text",
 }
 
+# file types whose datasets can read zip resources
+COMPRESSIBLE_TYPES = ["csv"]
+
+CHUNK_SIZE = 1024 * 1024
+
+CSV_DELIMITERS = ",;\t|"
+
 
 class KaggleDataset:
     """Kaggle Dataset Object for Internal Purpose"""
@@ -51,19 +68,38 @@ def get_slugs(dataset) -> KaggleDataset:
     return KaggleDataset(owner="", name="")
 
 
-def upload_file(
-    dataset_id: str, remote_file_name: str, path: str, context: ExecutionContext
-):
-    """Check whether the file is downloaded or not"""
+def upload_file(  # pylint: disable=too-many-arguments
+    dataset_id: str,
+    remote_file_name: str,
+    path: str,
+    context: ExecutionContext,
+    compress: bool = False,
+    split_size: int = 0,
+) -> list[Tuple[str, str]]:
+    """Check whether the file is downloaded or not
+
+    Returns summary entries about the upload (compression ratio, timing).
+    """
     file_path = os.path.join(path, remote_file_name)
     try:
+        if split_size > 0 and file_path.endswith(".csv"):
+            return upload_split_csv_file(
+                dataset_id=dataset_id,
+                file_path=file_path,
+                context=context,
+                split_size=split_size,
+            )
+        if compress and supports_compressed_upload(file_path):
+            return upload_compressed_file(
+                dataset_id=dataset_id, file_path=file_path, context=context
+            )
         if os.path.isfile(file_path):
             create_resource_from_file(
                 dataset_id=dataset_id, remote_file_name=file_path, context=context
             )
         elif os.path.isfile(get_zip_file_path(file_path)):
             unzip_file(get_zip_file_path(file_path))
-            upload_file(
+            return upload_file(
                 dataset_id=dataset_id,
                 remote_file_name=remote_file_name,
                 path=path,
@@ -83,6 +119,224 @@ def upload_file(
                 summary=summary,
             )
         )
+    return []
+
+
+def upload_compressed_file(
+    dataset_id: str, file_path: str, context: ExecutionContext
+) -> list[Tuple[str, str]]:
+    """Upload a file as zip archive
+
+    A zip delivered by Kaggle is uploaded as it is, otherwise the file is
+    compressed first.
+    """
+    zip_file_path = get_zip_file_path(file_path)
+    compression_time = 0.0
+    if os.path.isfile(zip_file_path):
+        with ZipFile(zip_file_path, "r") as zip_file:
+            raw_size = sum(info.file_size for info in zip_file.infolist())
+    elif os.path.isfile(file_path):
+        raw_size = os.path.getsize(file_path)
+        start = time.monotonic()
+        compress_file(file_path=file_path, zip_file_path=zip_file_path)
+        compression_time = time.monotonic() - start
+    else:
+        raise FileNotFoundError
+    upload_size = os.path.getsize(zip_file_path)
+    start = time.monotonic()
+    create_resource_from_file(
+        dataset_id=dataset_id, remote_file_name=zip_file_path, context=context
+    )
+    return compression_summary(
+        raw_size=raw_size,
+        upload_size=upload_size,
+        upload_time=time.monotonic() - start,
+        compression_time=compression_time,
+    )
+
+
+def get_dataset_file(dataset_id: str, context: ExecutionContext) -> str:
+    """Returns the file resource name of a dataset"""
+    setup_cmempy_user_access(context=context.user)
+    project_id, task_id = split_task_id(dataset_id)
+    task = get_task(project=project_id, task=task_id, with_labels=False)
+    return str(task["data"]["parameters"].get("file", ""))
+
+
+def supports_compressed_upload(file_name: str) -> bool:
+    """Check whether the dataset of a file type can read zip resources"""
+    return file_name.split(".")[-1] in COMPRESSIBLE_TYPES
+
+
+def upload_split_csv_file(
+    dataset_id: str, file_path: str, context: ExecutionContext, split_size: int
+) -> list[Tuple[str, str]]:
+    """Upload a CSV file as multiCsv zip archive of parts with split_size MB
+
+    A zip delivered by Kaggle is read as a stream without extracting it.
+    """
+    zip_file_path = get_zip_file_path(file_path)
+    parts_file_path = f"{file_path}.parts.zip"
+    part_name = unquote(os.path.basename(file_path))
+    with ExitStack() as stack:
+        if os.path.isfile(zip_file_path):
+            zip_file = stack.enter_context(ZipFile(zip_file_path, "r"))
+            member = get_zip_member(zip_file=zip_file, file_name=part_name)
+            raw_size = member.file_size
+            source = stack.enter_context(zip_file.open(member, "r"))
+        elif os.path.isfile(file_path):
+            raw_size = os.path.getsize(file_path)
+            source = stack.enter_context(open(file_path, "rb"))
+        else:
+            raise FileNotFoundError
+        start = time.monotonic()
+        parts = split_csv(
+            source=source,
+            zip_file_path=parts_file_path,
+            part_name=part_name,
+            part_size=split_size * 1024 * 1024,
+        )
+        compression_time = time.monotonic() - start
+    upload_size = os.path.getsize(parts_file_path)
+    start = time.monotonic()
+    create_resource_from_file(
+        dataset_id=dataset_id, remote_file_name=parts_file_path, context=context
+    )
+    summary = [("CSV parts", str(parts))]
+    summary.extend(
+        compression_summary(
+            raw_size=raw_size,
+            upload_size=upload_size,
+            upload_time=time.monotonic() - start,
+            compression_time=compression_time,
+        )
+    )
+    return summary
+
+
+def get_zip_member(zip_file: ZipFile, file_name: str) -> ZipInfo:
+    """Find the archive member of a file, also when nested in a directory
+
+    Falls back to the only CSV member of the archive.
+    """
+    members = [info for info in zip_file.infolist() if not info.is_dir()]
+    for info in members:
+        if os.path.basename(info.filename) == file_name:
+            return info
+    csv_members = [info for info in members if info.filename.endswith(".csv")]
+    if len(csv_members) == 1:
+        return csv_members[0]
+    raise FileNotFoundError
+
+
+def sniff_csv_delimiter(line: bytes) -> bytes:
+    """Detect the delimiter of a CSV file from its header line"""
+    try:
+        dialect = csv.Sniffer().sniff(
+            line.decode("utf-8", errors="replace"), delimiters=CSV_DELIMITERS
+        )
+    except csv.Error:
+        return b","
+    return dialect.delimiter.encode()
+
+
+def read_csv_record(
+    source: IO[bytes], delimiter: bytes = b",", line: bytes | None = None
+) -> bytes:
+    """Read the next CSV record, including line breaks in quoted values
+
+    A quote only opens a quoted value at the start of a field (RFC 4180), so
+    stray quotes inside unquoted values do not join the following lines.
+    The record starts with line, if it was already read from the source.
+    """
+    tokens = re.compile(b'["' + re.escape(delimiter) + b"]")
+    lines = []
+    quoted = False
+    if line is None:
+        line = source.readline()
+    while line:
+        lines.append(line)
+        field_start = -1 if quoted else 0
+        closed_at = -2
+        for token in tokens.finditer(line):
+            position = token.start()
+            if quoted:
+                if token.group() == b'"':
+                    quoted = False
+                    closed_at = position
+            elif token.group() == delimiter:
+                field_start = position + 1
+            elif position in (field_start, closed_at + 1):
+                # opening quote or escaped quote ("") within a quoted value
+                quoted = True
+        if not quoted:
+            break
+        line = source.readline()
+    return b"".join(lines)
+
+
+def split_csv(
+    source: IO[bytes], zip_file_path: str, part_name: str, part_size: int
+) -> int:
+    """Split a CSV stream into the parts of a multiCsv zip archive
+
+    Parts are cut on record boundaries after part_size bytes and every part
+    starts with the header record. The delimiter is detected from the header.
+    Returns the number of parts.
+    """
+    stem = part_name.removesuffix(".csv")
+    line = source.readline()
+    delimiter = sniff_csv_delimiter(line)
+    header = read_csv_record(source=source, delimiter=delimiter, line=line)
+    parts = 0
+    with ZipFile(zip_file_path, "w", compression=ZIP_DEFLATED) as zip_file:
+        record = read_csv_record(source=source, delimiter=delimiter)
+        while record or parts == 0:
+            parts += 1
+            with zip_file.open(
+                f"{stem}_{parts:04d}.csv", "w", force_zip64=True
+            ) as target:
+                target.write(header)
+                written = 0
+                while record and written < part_size:
+                    target.write(record)
+                    written += len(record)
+                    record = read_csv_record(source=source, delimiter=delimiter)
+    return parts
+
+
+def compress_file(file_path: str, zip_file_path: str):
+    """Compress the file into a zip archive chunk by chunk"""
+    with ZipFile(zip_file_path, "w", compression=ZIP_DEFLATED) as zip_file:
+        with open(file_path, "rb") as source, zip_file.open(
+            os.path.basename(file_path), "w", force_zip64=True
+        ) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def compression_summary(
+    raw_size: int, upload_size: int, upload_time: float, compression_time: float = 0.0
+) -> list[Tuple[str, str]]:
+    """Summary entries of a compressed upload
+
+    The time saved is estimated from the measured upload throughput, minus the
+    time spent on compression. A negative saving is reported as time lost.
+    """
+    summary = [
+        ("Uncompressed size (bytes)", str(raw_size)),
+        ("Uploaded size (bytes)", str(upload_size)),
+        ("Compression time (s)", f"{compression_time:.2f}"),
+        ("Upload time (s)", f"{upload_time:.2f}"),
+    ]
+    if upload_size > 0:
+        summary.append(("Compression ratio", f"{raw_size / upload_size:.2f}"))
+        raw_upload_time = upload_time * raw_size / upload_size
+        time_saved = raw_upload_time - upload_time - compression_time
+        if time_saved >= 0:
+            summary.append(("Estimated time saved (s)", f"{time_saved:.2f}"))
+        else:
+            summary.append(("Estimated time lost (s)", f"{-time_saved:.2f}"))
+    return summary
 
 
 def get_zip_file_path(file_name) -> str:
@@ -153,10 +407,15 @@ class DatasetFileType(DatasetParameterType):
         depend_on_parameter_values: list[Any],
         context: PluginContext,
     ) -> list[Autocompletion]:
+        file_type = depend_on_parameter_values[0].split(".")[-1]
         try:
-            self.dataset_type = DATASET_TYPES[
-                depend_on_parameter_values[0].split(".")[-1]
-            ]
+            split_size = int(depend_on_parameter_values[1])
+        except (IndexError, TypeError, ValueError):
+            split_size = 0
+        if file_type == "csv" and split_size > 0:
+            file_type = "zip"
+        try:
+            self.dataset_type = DATASET_TYPES[file_type]
         except KeyError:
             self.dataset_type = ""
         return super().autocomplete(  # type: ignore
@@ -279,7 +538,28 @@ which you can obtain from the [Kaggle Public API](https://www.kaggle.com/docs/ap
             name="dataset",
             label="Dataset",
             description="To which Dataset to write the response",
-            param_type=DatasetFileType(dependent_params=["file_name"]),
+            param_type=DatasetFileType(dependent_params=["file_name", "split_size"]),
+        ),
+        PluginParameter(
+            name="compress_upload",
+            label="Compressed Upload",
+            description="Upload csv files as zip archive to a dataset with a zip "
+            "file resource. A zip delivered by Kaggle is kept as it is, otherwise "
+            "the file is compressed before the upload. Other file types and "
+            "datasets are uploaded uncompressed.",
+            default_value=False,
+            advanced=True,
+        ),
+        PluginParameter(
+            name="split_size",
+            label="Split CSV Size (MB)",
+            description="Split a CSV file into parts of this size and upload them "
+            "as zip archive for a multiCsv dataset. Parts are cut on record "
+            "boundaries and each part repeats the header. 0 disables splitting. "
+            "The parts are always compressed, so this replaces the compressed "
+            "upload for CSV files.",
+            default_value=0,
+            advanced=True,
         ),
     ],
 )
@@ -294,6 +574,8 @@ class KaggleImport(WorkflowPlugin):
         kaggle_dataset: str,
         file_name: str,
         dataset: str,
+        compress_upload: bool = False,
+        split_size: int = 0,
     ) -> None:
         self.username = username
         self.api_key = api_key
@@ -308,6 +590,10 @@ class KaggleImport(WorkflowPlugin):
         self.kaggle_dataset = kaggle_dataset
         self.file_name = file_name
         self.dataset = dataset
+        self.compress_upload = compress_upload
+        if split_size < 0:
+            raise ValueError("Split CSV size must not be negative")
+        self.split_size = split_size
 
     def execute(self, inputs: Sequence[Entities], context: ExecutionContext) -> None:
         summary: list[Tuple[str, str]] = []
@@ -321,6 +607,12 @@ class KaggleImport(WorkflowPlugin):
         dataset_id = f"{context.task.project_id()}:{self.dataset}"
 
         dataset_file_name = self.get_downloadable_file_name()
+        compress = self.use_compressed_upload(
+            dataset_id=dataset_id,
+            dataset_file_name=dataset_file_name,
+            context=context,
+            warnings=warnings,
+        )
 
         with tempfile.TemporaryDirectory() as temp_dir:
             context.report.update(
@@ -333,16 +625,19 @@ class KaggleImport(WorkflowPlugin):
                 dataset=self.kaggle_dataset, file_name=dataset_file_name, path=temp_dir
             )
             time.sleep(1)
-            upload_file(
+            upload_summary = upload_file(
                 dataset_id=dataset_id,
                 remote_file_name=dataset_file_name,
                 path=temp_dir,
                 context=context,
+                compress=compress,
+                split_size=self.split_size,
             )
 
         summary.append(("Kaggle Dataset", self.kaggle_dataset))
         summary.append(("File", dataset_file_name))
         summary.append(("Dataset ID", dataset_id))
+        summary.extend(upload_summary)
 
         context.report.update(
             ExecutionReport(
@@ -354,6 +649,38 @@ class KaggleImport(WorkflowPlugin):
             )
         )
 
+    def use_compressed_upload(
+        self,
+        dataset_id: str,
+        dataset_file_name: str,
+        context: ExecutionContext,
+        warnings: list[str],
+    ) -> bool:
+        """Check whether the file can be uploaded compressed to the dataset"""
+        if not self.compress_upload or dataset_file_name.endswith(".zip"):
+            return False
+        if self.split_size > 0 and dataset_file_name.endswith(".csv"):
+            warnings.append(
+                "Compressed upload is replaced by the split CSV option, "
+                "the parts are uploaded as zip archive"
+            )
+            return False
+        if not supports_compressed_upload(dataset_file_name):
+            warnings.append(
+                f"Compressed upload is not supported for {dataset_file_name}, "
+                "the file is uploaded uncompressed"
+            )
+            return False
+        if not get_dataset_file(dataset_id=dataset_id, context=context).endswith(
+            ".zip"
+        ):
+            warnings.append(
+                "Compressed upload needs a dataset with a zip file resource, "
+                "the file is uploaded uncompressed"
+            )
+            return False
+        return True
+
     def get_downloadable_file_name(self) -> str:
         """Get the file name for the dataset"""
         dataset_filename = ""
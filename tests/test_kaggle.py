@@ -1,18 +1,34 @@
 """Plugin tests."""
+import csv
+from io import BytesIO, TextIOWrapper
+from zipfile import ZipFile
+
 import pytest
 from cmem.cmempy.workspace.projects.project import make_new_project, delete_project
 from cmem.cmempy.workspace.projects.datasets.dataset import (
     make_new_dataset,
 )
-from cmem.cmempy.workspace.projects.resources.resource import resource_exist
+from cmem.cmempy.workspace.projects.resources.resource import (
+    get_resource,
+    resource_exist,
+)
+from cmem_plugin_base.dataintegration.parameter.dataset import DatasetParameterType
 from cmem_plugin_base.dataintegration.parameter.password import Password
 from cmem_plugin_base.dataintegration.types import Autocompletion
+from cmem_plugin_kaggle import kaggle_import
 from cmem_plugin_kaggle.kaggle_import import (
     KaggleImport,
     KaggleSearch,
     DatasetFile,
     DatasetFileType,
     auth,
+    compress_file,
+    compression_summary,
+    read_csv_record,
+    split_csv,
+    upload_compressed_file,
+    upload_file,
+    upload_split_csv_file,
 )
 from tests.utils import (
     needs_cmem,
@@ -28,6 +44,7 @@ PROJECT_NAME = "kaggle_test_project"
 DATASET_NAME = "test-dataset"
 DATASET_TYPE = "csv"
 RESOURCE_NAME = f"{DATASET_NAME}.{DATASET_TYPE}"
+ZIP_RESOURCE_NAME = f"{DATASET_NAME}.zip"
 KAGGLE_DATASET = "rangareddynukala/cmem-plugin-kaggle-test"
 KAGGLE_CONFIG = get_kaggle_config()
 KAGGLE_KEY = Password(encrypted_value=KAGGLE_CONFIG["key"], system=TestSystemContext())
@@ -99,6 +116,48 @@ def _project():
     delete_project(PROJECT_NAME)
 
 
+@pytest.fixture(name="zip_project")
+def _zip_project():
+    """Provides the DI build project with a zip file resource dataset."""
+    make_new_project(PROJECT_NAME)
+    make_new_dataset(
+        project_name=PROJECT_NAME,
+        dataset_name=DATASET_NAME,
+        dataset_type="csv",
+        parameters={"file": ZIP_RESOURCE_NAME},
+        autoconfigure=False,
+    )
+
+    yield None
+    delete_project(PROJECT_NAME)
+
+
+@pytest.fixture(name="multi_csv_project")
+def _multi_csv_project():
+    """Provides the DI build project with a multiCsv dataset."""
+    make_new_project(PROJECT_NAME)
+    make_new_dataset(
+        project_name=PROJECT_NAME,
+        dataset_name=DATASET_NAME,
+        dataset_type="multiCsv",
+        parameters={"file": ZIP_RESOURCE_NAME},
+        autoconfigure=False,
+    )
+
+    yield None
+    delete_project(PROJECT_NAME)
+
+
+def read_zip_resource(resource_name: str) -> dict[str, list[list[str]]]:
+    """Read the CSV members of a zip resource of the test project"""
+    content = get_resource(project_name=PROJECT_NAME, resource_name=resource_name)
+    with ZipFile(BytesIO(content), "r") as zip_file:
+        return {
+            name: list(csv.reader(TextIOWrapper(zip_file.open(name), "utf-8")))
+            for name in zip_file.namelist()
+        }
+
+
 @needs_cmem
 @needs_kaggle
 def test_execution(project):
@@ -116,6 +175,70 @@ def test_execution(project):
     )
 
 
+@needs_cmem
+@needs_kaggle
+def test_execution_compressed(zip_project):
+    """Test plugin execution with compressed upload to a zip resource"""
+    _ = zip_project
+    KaggleImport(
+        username=KAGGLE_CONFIG["username"],
+        api_key=KAGGLE_KEY,
+        kaggle_dataset=KAGGLE_DATASET,
+        file_name="test csv.csv",
+        dataset=DATASET_NAME,
+        compress_upload=True,
+    ).execute(inputs=[], context=TestExecutionContext(project_id=PROJECT_NAME))
+    assert (
+        resource_exist(project_name=PROJECT_NAME, resource_name=ZIP_RESOURCE_NAME)
+        is True
+    )
+    members = read_zip_resource(ZIP_RESOURCE_NAME)
+    assert len(members) == 1
+    rows = next(iter(members.values()))
+    assert len(rows) > 1
+
+
+@needs_cmem
+@needs_kaggle
+def test_execution_compressed_plain_resource(project):
+    """Test that compressed upload keeps a plain csv resource uncompressed"""
+    _ = project
+    KaggleImport(
+        username=KAGGLE_CONFIG["username"],
+        api_key=KAGGLE_KEY,
+        kaggle_dataset=KAGGLE_DATASET,
+        file_name="test csv.csv",
+        dataset=DATASET_NAME,
+        compress_upload=True,
+    ).execute(inputs=[], context=TestExecutionContext(project_id=PROJECT_NAME))
+    content = get_resource(project_name=PROJECT_NAME, resource_name=RESOURCE_NAME)
+    assert not content.startswith(b"PK")
+
+
+@needs_cmem
+@needs_kaggle
+def test_execution_split(multi_csv_project):
+    """Test plugin execution with a split CSV file to a multiCsv dataset"""
+    _ = multi_csv_project
+    KaggleImport(
+        username=KAGGLE_CONFIG["username"],
+        api_key=KAGGLE_KEY,
+        kaggle_dataset=KAGGLE_DATASET,
+        file_name="test csv.csv",
+        dataset=DATASET_NAME,
+        split_size=1,
+    ).execute(inputs=[], context=TestExecutionContext(project_id=PROJECT_NAME))
+    assert (
+        resource_exist(project_name=PROJECT_NAME, resource_name=ZIP_RESOURCE_NAME)
+        is True
+    )
+    members = read_zip_resource(ZIP_RESOURCE_NAME)
+    assert len(members) >= 1
+    headers = {tuple(rows[0]) for rows in members.values()}
+    assert len(headers) == 1
+    assert all(name.endswith(".csv") for name in members)
+
+
 @needs_cmem
 @needs_kaggle
 def test_single_file_zip(project):
@@ -207,3 +330,227 @@ def test_dataset_file_completion():
     assert isinstance(completion, list)
     assert len(completion) == 23
     assert completion[1] == Autocompletion(value="apple.csv", label="apple.csv")
+
+
+def test_compress_file(tmp_path):
+    """Test compressing a file for upload"""
+    file_path = tmp_path / "test.csv"
+    content = "name,value\n" + "kaggle,1\n" * 1000
+    file_path.write_text(content)
+    zip_file_path = tmp_path / "test.csv.zip"
+    compress_file(file_path=str(file_path), zip_file_path=str(zip_file_path))
+    with ZipFile(zip_file_path, "r") as zip_file:
+        assert zip_file.namelist() == ["test.csv"]
+        assert zip_file.read("test.csv").decode() == content
+    assert zip_file_path.stat().st_size < file_path.stat().st_size
+
+
+def test_compression_summary():
+    """Test the report entries of a compressed upload"""
+    summary = dict(
+        compression_summary(
+            raw_size=1000, upload_size=250, upload_time=2.0, compression_time=1.0
+        )
+    )
+    assert summary["Compression ratio"] == "4.00"
+    assert summary["Compression time (s)"] == "1.00"
+    assert summary["Estimated time saved (s)"] == "5.00"
+
+    # compression slower than the saved upload time
+    summary = dict(
+        compression_summary(
+            raw_size=1000, upload_size=500, upload_time=1.0, compression_time=3.0
+        )
+    )
+    assert summary["Estimated time lost (s)"] == "2.00"
+
+    # compressed output larger than the input
+    summary = dict(compression_summary(raw_size=100, upload_size=200, upload_time=1.0))
+    assert summary["Compression ratio"] == "0.50"
+    assert summary["Estimated time lost (s)"] == "0.50"
+    assert "Estimated time saved (s)" not in summary
+
+
+@pytest.fixture(name="uploads")
+def _uploads(monkeypatch):
+    """Records uploaded files instead of creating resources in CMEM."""
+    uploaded: list[str] = []
+
+    def create_resource_from_file(dataset_id, remote_file_name, context):
+        _ = dataset_id, context
+        uploaded.append(remote_file_name)
+
+    monkeypatch.setattr(
+        kaggle_import, "create_resource_from_file", create_resource_from_file
+    )
+    return uploaded
+
+
+def test_upload_compressed_kaggle_zip(tmp_path, uploads):
+    """Test that a zip delivered by Kaggle is uploaded as it is"""
+    zip_file_path = tmp_path / "test.csv.zip"
+    with ZipFile(zip_file_path, "w") as zip_file:
+        zip_file.writestr("test.csv", "name,value\n" * 100)
+    summary = dict(
+        upload_compressed_file(
+            dataset_id="project:dataset",
+            file_path=str(tmp_path / "test.csv"),
+            context=TestExecutionContext(user=None),
+        )
+    )
+    assert uploads == [str(zip_file_path)]
+    assert summary["Uncompressed size (bytes)"] == "1100"
+    assert summary["Compression time (s)"] == "0.00"
+    assert not (tmp_path / "test.csv").exists()
+
+
+def test_upload_compressed_plain_file(tmp_path, uploads):
+    """Test that a plain file is compressed before the upload"""
+    file_path = tmp_path / "test.csv"
+    file_path.write_text("name,value\n" * 100)
+    summary = dict(
+        upload_compressed_file(
+            dataset_id="project:dataset",
+            file_path=str(file_path),
+            context=TestExecutionContext(user=None),
+        )
+    )
+    assert uploads == [f"{file_path}.zip"]
+    with ZipFile(uploads[0], "r") as zip_file:
+        assert zip_file.read("test.csv") == file_path.read_bytes()
+    assert summary["Uncompressed size (bytes)"] == "1100"
+
+
+def test_upload_file_compress_unsupported(tmp_path, uploads):
+    """Test that zip and xlsx files are uploaded without compression"""
+    for file_name in ["test.zip", "test.xlsx"]:
+        (tmp_path / file_name).write_bytes(b"content")
+        summary = upload_file(
+            dataset_id="project:dataset",
+            remote_file_name=file_name,
+            path=str(tmp_path),
+            context=TestExecutionContext(user=None),
+            compress=True,
+        )
+        assert summary == []
+    assert uploads == [str(tmp_path / "test.zip"), str(tmp_path / "test.xlsx")]
+
+
+def test_split_csv(tmp_path):
+    """Test splitting a CSV file into multiCsv parts"""
+    content = b'id,text\n1,"multi\nline"\n2,"quoted ""\n"""\n3,plain\n'
+    zip_file_path = tmp_path / "parts.zip"
+    parts = split_csv(
+        source=BytesIO(content),
+        zip_file_path=str(zip_file_path),
+        part_name="test.csv",
+        part_size=20,
+    )
+    assert parts == 2
+    with ZipFile(zip_file_path, "r") as zip_file:
+        assert zip_file.namelist() == ["test_0001.csv", "test_0002.csv"]
+        assert (
+            zip_file.read("test_0001.csv")
+            == b'id,text\n1,"multi\nline"\n2,"quoted ""\n"""\n'
+        )
+        assert zip_file.read("test_0002.csv") == b"id,text\n3,plain\n"
+
+
+def test_split_csv_stray_quote(tmp_path):
+    """Test that a quote inside an unquoted value does not join records"""
+    content = b'id,height\n1,5\'10"\n2,6\'1"\n3,"5\'8"""\n4,6\n'
+    zip_file_path = tmp_path / "parts.zip"
+    parts = split_csv(
+        source=BytesIO(content),
+        zip_file_path=str(zip_file_path),
+        part_name="test.csv",
+        part_size=1,
+    )
+    assert parts == 4
+    with ZipFile(zip_file_path, "r") as zip_file:
+        assert zip_file.read("test_0001.csv") == b"id,height\n1,5'10\"\n"
+        assert zip_file.read("test_0003.csv") == b'id,height\n3,"5\'8"""\n'
+        assert zip_file.read("test_0004.csv") == b"id,height\n4,6\n"
+
+
+def test_read_csv_record_multi_line():
+    """Test reading long multi-line records in linear time"""
+    lines = 100000
+    quoted_record = b'1,"' + b"line\n" * lines + b'end"\n'
+    stray_record = b"2,5'10\"\n"
+    source = BytesIO(quoted_record + stray_record * lines)
+    assert read_csv_record(source) == quoted_record
+    for _ in range(lines):
+        assert read_csv_record(source) == stray_record
+    assert read_csv_record(source) == b""
+
+
+def test_upload_split_csv_file_zip_member(tmp_path, uploads):
+    """Test splitting a CSV nested in a Kaggle zip with an encoded name"""
+    with ZipFile(tmp_path / "test%20csv.csv.zip", "w") as zip_file:
+        zip_file.writestr("data/test csv.csv", "id,value\n1,a\n2,b\n")
+    summary = dict(
+        upload_split_csv_file(
+            dataset_id="project:dataset",
+            file_path=str(tmp_path / "test%20csv.csv"),
+            context=TestExecutionContext(user=None),
+            split_size=1,
+        )
+    )
+    assert summary["CSV parts"] == "1"
+    assert uploads == [str(tmp_path / "test%20csv.csv.parts.zip")]
+    with ZipFile(uploads[0], "r") as zip_file:
+        assert zip_file.namelist() == ["test csv_0001.csv"]
+
+
+def test_upload_split_csv_file_missing_member(tmp_path, uploads):
+    """Test that an ambiguous Kaggle zip is reported instead of crashing"""
+    with ZipFile(tmp_path / "test.csv.zip", "w") as zip_file:
+        zip_file.writestr("first.csv", "id\n1\n")
+        zip_file.writestr("second.csv", "id\n2\n")
+    summary = upload_file(
+        dataset_id="project:dataset",
+        remote_file_name="test.csv",
+        path=str(tmp_path),
+        context=TestExecutionContext(user=None),
+        split_size=1,
+    )
+    assert summary == []
+    assert uploads == []
+
+
+def test_dataset_file_type_split_completion(monkeypatch):
+    """Test that splitting a CSV file completes multiCsv datasets"""
+    monkeypatch.setattr(
+        DatasetParameterType, "autocomplete", lambda *args, **kwargs: []
+    )
+    parameter = DatasetFileType(dependent_params=["file_name", "split_size"])
+    parameter.autocomplete(
+        query_terms=[],
+        depend_on_parameter_values=["x.csv", "10"],
+        context=TestTaskContext(),
+    )
+    assert parameter.dataset_type == "multiCsv"
+    parameter.autocomplete(
+        query_terms=[],
+        depend_on_parameter_values=["x.csv", "0"],
+        context=TestTaskContext(),
+    )
+    assert parameter.dataset_type == "csv"
+
+
+def test_split_csv_semicolon(tmp_path):
+    """Test splitting a semicolon separated CSV with a multi-line value"""
+    content = b'id;text;note\n1;"multi\nline";a\n2;x;"b;\nc"\n3;y;z\n'
+    zip_file_path = tmp_path / "parts.zip"
+    parts = split_csv(
+        source=BytesIO(content),
+        zip_file_path=str(zip_file_path),
+        part_name="test.csv",
+        part_size=1,
+    )
+    assert parts == 3
+    with ZipFile(zip_file_path, "r") as zip_file:
+        assert zip_file.read("test_0001.csv") == b'id;text;note\n1;"multi\nline";a\n'
+        assert zip_file.read("test_0002.csv") == b'id;text;note\n2;x;"b;\nc"\n'
+        assert zip_file.read("test_0003.csv") == b"id;text;note\n3;y;z\n"